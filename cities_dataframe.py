@@ -9,16 +9,45 @@
 
 downloaded = False  #RMK: True state not fully worked yet!
 
+#The batch can be split across several machines. Each one must run this
+# script with the same number of shards and its own shard index (starting at
+# 0), and it writes the file "cities_shard<index>.csv". The split is saved in
+# "shards.csv" by the first run, which should be copied to the other machines
+# so that all of them agree. Once all of them are done, running it with
+# merge = True collects the shards into "cities.csv":
+
+n_shards = 1
+shard = 0
+merge = False
+
+#Costs are estimated from a previous "cities.csv" when available. For the
+# cities missing there we use the outline area, calibrated on a few known
+# cities:
+
+n_calibration = 10
+
+#Motif vectors of graphs we have already counted are stored in the directory
+# below and reused when the same graph shows up again (set it to None to
+# always count). At most memo_size entries are kept:
+
+memo_directory = "./Memo/"
+memo_size = 1000
+
+#With more than one worker, the graphs are downloaded by this process and
+# counted by separate worker processes (see pipeline.py):
+
+n_workers = 1
+
 #############################################################################
 
 import pandas as pd
-import networkx as nx
 import osmnx as ox
 import csv
 
 from datetime import datetime
 
-import mcount
+import pipeline
+import scheduling
 
 if downloaded == False:
     import getdata
@@ -27,7 +56,8 @@ if downloaded == False:
 
 #The following function collects network information (nodes, edges, selfloops,
 # and motifs) for a city string---that is, "city, country":
-def get_network_info(city_str, verbose=False, draw=False, downloaded=False):
+def get_network_info(city_str, verbose=False, draw=False, downloaded=False,
+                     memo_dir=memo_directory):
     if verbose == True:
         print("city:", city_str)
     start = datetime.now()
@@ -47,16 +77,17 @@ def get_network_info(city_str, verbose=False, draw=False, downloaded=False):
         ox.plot_graph(graph)
     if verbose == True:
         print("Took", datetime.now()-start, "seconds to get the graph")
-    n = graph.order()
-    m = graph.size()
-    sl = nx.number_of_selfloops(graph)
     #Now we prepare the graph for our data through removing multiple edges
-    # and self-loops:
-    new_graph = nx.Graph(graph)
-    new_graph.remove_edges_from(nx.selfloop_edges(new_graph))
-    #We collect the new number of edges and the motif vector:
-    m_simp = new_graph.size()
-    motif_vector = mcount.get_motifvector(new_graph)
+    # and self-loops, and collect the new number of edges. If this exact
+    # graph was counted before, we reuse the stored result:
+    info, new_graph, fingerprint, motif_vector = pipeline.simplify(graph,
+                                                                   memo_dir)
+    n, m, m_simp, sl = info
+    if motif_vector is not None:
+        if verbose == True:
+            print("Found the motif vector in the memo")
+        return n, m, m_simp, sl, motif_vector
+    motif_vector = pipeline.count(new_graph, fingerprint, memo_dir, memo_size)
     if verbose == True:
         print("Took", datetime.now()-start, "seconds for everything")
     return n, m, m_simp, sl, motif_vector
@@ -78,7 +109,8 @@ def read_cities(cities_file, dlm=";"):
 
 #The following function takes the cities csv list and creates the dataframe
 # with all information we want:
-def get_dataframe(cities_file, dlm=";", verbose=False):
+def get_dataframe(cities_file, dlm=";", verbose=False, indices=None,
+                  output_file="cities.csv"):
     #First we create an empty dataframe with the columns we want:
     column_names = ["City", "Country", "Continent", "Nodes", "Edges",
                     "Essential edges", "Self-loops", "3-paths", "Triangles",
@@ -88,13 +120,26 @@ def get_dataframe(cities_file, dlm=";", verbose=False):
     #We get the basic information from the list of cities that we have:
     cities, countries, continents = read_cities(cities_file, dlm)
     #Now we will iterate over this list of cities and get the network info
-    # for each of them, appending it to our dataframe.
-    for idx in range(len(cities)):
+    # for each of them, appending it to our dataframe. If only some indices
+    # were requested (a shard), we keep their original positions:
+    if indices is None:
+        indices = range(len(cities))
+    indices = list(indices)
+    city_strs = [cities[idx].replace("_", " ") + ", "
+                 + countries[idx].replace("_", " ") for idx in indices]
+    #The infos come as (position in indices, network info), either from the
+    # pipeline of workers or computed here one at a time:
+    if n_workers > 1 and downloaded == False:
+        infos = pipeline.run_pipeline(city_strs, n_workers, memo_directory,
+                                      memo_size, verbose)
+    else:
+        infos = enumerate(get_network_info(city_str, verbose, False)
+                          for city_str in city_strs)
+    for pos, (n, m, m_simp, sl, mf) in infos:
+        idx = indices[pos]
         city = cities[idx]
         country = countries[idx]
         continent = continents[idx]
-        city_str = city.replace("_", " ") + ", " + country.replace("_", " ")
-        n, m, m_simp, sl, mf = get_network_info(city_str, verbose, False)
         if n != None:
             new_row = [city, country, continent, n, m, m_simp, sl,
                        mf[0], mf[1], mf[2], mf[3], mf[4], mf[5], mf[6], mf[7]]
@@ -104,14 +149,78 @@ def get_dataframe(cities_file, dlm=";", verbose=False):
                            None, None, None, None, None, None, None, None]
         if verbose == True:
                 print("Row", idx, "appended!\n")
-        df.to_csv('cities.csv')
+        #With several workers the rows come in the order the cities finish,
+        # so we keep them in the order of the list:
+        df = df.sort_index()
+        df.to_csv(output_file)
     return df
 
+#The following function estimates the cost of each city in the list and
+# splits it into n_shards balanced lists of indices, longest city first. The
+# split is stored in shards_file and read from there if it already exists:
+def get_shards(cities_file, n_shards, dlm=";", cities_df_file="cities.csv",
+               shards_file="shards.csv", verbose=False):
+    cities, countries, continents = read_cities(cities_file, dlm)
+    key = scheduling.get_list_key(cities, countries)
+    try:
+        shards_df = pd.read_csv(shards_file)
+        shards = scheduling.read_shards(shards_df, n_shards, key)
+        if shards is not None:
+            return shards
+    except FileNotFoundError:
+        pass
+    try:
+        cities_df = pd.read_csv(cities_df_file, index_col=0)
+        costs = scheduling.get_known_costs(cities, countries, cities_df)
+    except FileNotFoundError:
+        cities_df = None
+        costs = [None]*len(cities)
+    #We only look up outlines for the unknown cities and a few known ones
+    # (none at all if every cost is known):
+    areas = [None]*len(cities)
+    calibrated = 0
+    for idx in range(len(cities)):
+        if downloaded == True or None not in costs:
+            break
+        if costs[idx] is not None:
+            if calibrated >= n_calibration:
+                continue
+            calibrated += 1
+        city_str = (cities[idx].replace("_", " ") + ", "
+                    + countries[idx].replace("_", " "))
+        areas[idx] = getdata.get_outline_area(city_str)
+    costs = scheduling.estimate_costs(cities, countries, cities_df, areas)
+    shards = scheduling.get_shards(costs, n_shards)
+    if verbose == True:
+        loads = scheduling.get_shard_loads(costs, shards)
+        print("Ideal load per shard:", sum(costs)/n_shards)
+        print("Estimated loads:", loads)
+    shards_df = scheduling.shards_dataframe(shards, costs, key)
+    shards_df.to_csv(shards_file, index=False)
+    return shards
+
 #############################################################################
 
-file = "list_of_cities.csv"
-df = get_dataframe(file, verbose=True)
+#RMK: The script only runs when called directly, since the counting workers
+#      may import this file again when they start.
+
+if __name__ == "__main__":
+    file = "list_of_cities.csv"
+
+    if merge == True:
+        shard_files = ["cities_shard" + str(i) + ".csv"
+                       for i in range(n_shards)]
+        df = scheduling.merge_shards(shard_files)
+        output_file = "cities.csv"
+    elif n_shards > 1:
+        shards = get_shards(file, n_shards, verbose=True)
+        output_file = "cities_shard" + str(shard) + ".csv"
+        df = get_dataframe(file, verbose=True, indices=shards[shard],
+                           output_file=output_file)
+    else:
+        output_file = "cities.csv"
+        df = get_dataframe(file, verbose=True)
 
-print(df)
+    print(df)
 
-df.to_csv('cities.csv')
\ No newline at end of file
+    df.to_csv(output_file)
\ No newline at end of file
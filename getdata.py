@@ -8,63 +8,93 @@
 #############################################################################
 
 import osmnx as ox
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import shape
 
 #############################################################################
 
-#This function takes a gdf file and inspects it. It is called a few times by
-# the get_outline function, so it is convenient to keep it apart from it:
-def inspect(gdf, success = False, error = None):
-    #The result must be a Polygon or Multipolygon in type:
-    gdf_type = gdf.geometry.geom_type[0]
-    if gdf_type == 'Polygon' or gdf_type == 'MultiPolygon':
-        #The result must have a reasonable size:
-        gdf_area = gdf.area[0]
-        if gdf_area > 1 or gdf_area < 0.0001:
-            #The shapefile is too small or too large to be correct.
-            error = "SizeError"
-        else:
-            #It worked!
-            success = True
-    #If the result is not of the correct type, that is our error:
-    else:
-        error = "NoPolygonError"
-    return gdf, success, error
+#The first function gets all the candidate results for a place from OSMnx in
+# a single query (up to i_max of them), as a GeoDataFrame in the same format
+# as ox.gdf_from_place, in the order given by the geocoder:
+def get_candidates(city_str, i_max = 4):
+    results = ox.osm_polygon_download(city_str, limit=i_max, polygon_geojson=1)
+    rows = []
+    for result in results:
+        rows.append({"geometry": shape(result["geojson"]),
+                     "place_name": result["display_name"],
+                     "importance": result.get("importance") or 0})
+    gdf = gpd.GeoDataFrame(rows, columns=["geometry", "place_name",
+                                          "importance"],
+                           geometry="geometry", crs="epsg:4326")
+    return gdf
+
+#This function inspects all candidates at once. The result must be a Polygon
+# or Multipolygon in type, and it must have a reasonable size (otherwise the
+# shapefile is too small or too large to be correct). The areas can be given
+# if they were already computed. Returns a Series with the reason each
+# candidate was rejected, or None if it is acceptable:
+def inspect(gdf, area=None):
+    is_polygon = gdf.geometry.geom_type.isin(["Polygon", "MultiPolygon"])
+    if area is None:
+        area = gdf.area
+    is_sized = (area <= 1) & (area >= 0.0001)
+    reasons = pd.Series(None, index=gdf.index, dtype=object)
+    reasons[is_polygon & ~is_sized] = "SizeError"
+    reasons[~is_polygon] = "NoPolygonError"
+    return reasons
 
+#The following function chooses the best candidate for a place. Among the
+# acceptable ones we keep the most important according to the geocoder (ties
+# go to the earliest result), and the others are reported as outranked. It
+# returns a success flag, an error message in case we can't find the city
+# outline, the chosen outline, and a report on every candidate:
+def resolve_outline(city_str, i_max = 4):
+    candidates = get_candidates(city_str, i_max)
+    area = candidates.area
+    report = pd.DataFrame({"place_name": candidates["place_name"],
+                           "geom_type": candidates.geometry.geom_type,
+                           "area": area,
+                           "rejected": inspect(candidates, area)})
+    #If there are no results, then there is nothing we can do:
+    if len(candidates) == 0:
+        return False, "NoResultError", candidates, report
+    accepted = report[report["rejected"].isnull()]
+    if len(accepted) == 0:
+        #We keep the first result and its error, as gdf_from_place would:
+        gdf = candidates.iloc[[0]].reset_index(drop=True)
+        return False, report["rejected"].iloc[0], gdf, report
+    ranking = candidates.loc[accepted.index, "importance"]
+    best = ranking.sort_values(ascending=False, kind="stable").index[0]
+    report.loc[accepted.index.drop(best), "rejected"] = "Outranked"
+    gdf = candidates.loc[[best]].reset_index(drop=True)
+    return True, None, gdf, report
 
-#The first get function will get the gdf file from OSMnx, which corresponds
-# to a city outline. There are several exceptions we should handle:
+#The outline of a city, as used to get its graph. Costs one request:
 def get_outline(city_str, i_max = 4):
-    #We define a success flag and an error message in case we can't find the
-    # city outline:
-    success = False
-    error = None
-    #Ideally, we should get it very simply from OSMnx:
-    gdf = ox.gdf_from_place(city_str)
-    #If there are no result, then there is nothing we can do:
-    if gdf.size == 0:
-        error = "NoResultError"
-    #In case there is at least one result, we should inspect it to know if it
-    # is good or if we need to search for other results:
-    else:
-        gdf, success, error = inspect(gdf)
-        #In case we did not achieve success, we can check other results of
-        # the gdf search:
-        if success == "False":
-            i = 2
-            while i < i_max and success == False:
-                try:
-                    gdf = ox.gdf_from_place(city_str, which_result=i)
-                    if gdf.size != 0:
-                        gdf, success, error = inspect(gdf)
-                        i += 1
-                    else:
-                        #In this case there are no more significant results:
-                        i = i_max
-                #Of course, there may not be i results. In this case there is
-                # no need on iterating further:
-                except:
-                    i = i_max
+    success, error, gdf, report = resolve_outline(city_str, i_max)
     return success, error, gdf
+
+#For a list of cities we can also collect the reports together, to see why
+# the candidates of each one were rejected. Cities for which the lookup
+# failed or found nothing get a single row with the error:
+def resolve_outlines(city_strs, i_max = 4):
+    outlines = []
+    reports = []
+    for city_str in city_strs:
+        try:
+            success, error, gdf, report = resolve_outline(city_str, i_max)
+        except Exception as e:
+            success, error, gdf = False, type(e).__name__, None
+            report = pd.DataFrame(columns=["place_name", "geom_type", "area",
+                                           "rejected"])
+        if len(report) == 0:
+            report = pd.DataFrame({"place_name": [None], "geom_type": [None],
+                                   "area": [None], "rejected": [error]})
+        outlines.append(gdf if success == True else None)
+        report.insert(0, "city", city_str)
+        reports.append(report)
+    return outlines, pd.concat(reports, ignore_index=True)
     
 
 #Now, given a city string, we can call the function above and get the graph
@@ -77,4 +107,17 @@ def get_graph(city_str):
     else:
         return None
 
+#The area of the outline is a cheap proxy for the size of the network, which
+# we use to estimate how long a city will take. Returns None if the outline
+# could not be found:
+def get_outline_area(city_str):
+    try:
+        success, error, gdf = get_outline(city_str)
+    except:
+        return None
+    if success == True:
+        return gdf.area[0]
+    else:
+        return None
+
 #############################################################################
\ No newline at end of file
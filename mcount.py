@@ -12,6 +12,11 @@
 import numpy as np
 import networkx as nx
 from itertools import combinations
+from time import perf_counter
+
+#Results stored by the memo (see memo.py) are only valid for the counting
+# code that produced them, so this must change whenever the counts do:
+version = "1"
 
 #############################################################################
 '''General subgraph counting'''
@@ -110,22 +115,93 @@ def count_tadpole4(graph, motifs=None):
     count = s  #since each tadpole has 1 degree-3 node, the count is precise
     return count
 
-#The following function produces the motif vector for a graph:
+#The names of the motifs, as in the dataframe, and the functions that count
+# them, in the order they must be called:
+
+motif_names = ["3-paths", "Triangles", "4-paths", "4-complete", "4-star",
+               "Squares", "Diamonds", "Tadpoles"]
+
+motif_counters = [count_path3, count_complete3, count_path4, count_complete4,
+                  count_star4, count_cycle4, count_diamond4, count_tadpole4]
+
+#The following function produces the motif vector for a graph. If a
+# dictionary is given as timings, it is filled with the seconds each count
+# took, keyed by the name of the motif:
     
-def get_motifvector(graph):
+def get_motifvector(graph, timings=None):
     motifs = np.zeros(8)
 
-    motifs[0] = count_path3(graph, motifs)
-    motifs[1] = count_complete3(graph, motifs)
-    motifs[2] = count_path4(graph, motifs)    
-    motifs[3] = count_complete4(graph, motifs)
-    motifs[4] = count_star4(graph, motifs)
-    motifs[5] = count_cycle4(graph, motifs)
-    motifs[6] = count_diamond4(graph, motifs)
-    motifs[7] = count_tadpole4(graph, motifs)
+    for idx in range(8):
+        start = perf_counter()
+        motifs[idx] = motif_counters[idx](graph, motifs)
+        if timings is not None:
+            timings[motif_names[idx]] = perf_counter() - start
     
     return motifs
 
+#############################################################################
+'''Incremental subgraph counting'''
+
+#When a graph grows one node at a time (for instance, nodes sorted by their
+# distance from a point), we don't need to count everything again: it is
+# enough to count the subgraphs that contain the new node. The function below
+# takes the current adjacency (a dictionary of sets), the number of triangles
+# at each node, and the motif vector, and updates all of them in place when
+# a node is added with its edges to the nodes already present. Neighbors that
+# were not added yet are ignored; their edges come in when they are added.
+
+def add_node(adj, triangles, motifs, node, neighbors):
+    nbrs = set(u for u in neighbors if u in adj and u != node)
+    k = len(nbrs)
+    degree = {u: len(adj[u]) for u in nbrs} #degrees before the new edges
+    #The edges among the new neighbors close triangles with the new node:
+    nbr_list = list(nbrs)
+    position = {u: i for i, u in enumerate(nbr_list)}
+    pairs = [(a, b) for a in nbr_list for b in adj[a] & nbrs
+             if position[a] < position[b]]
+    e_nbrs = len(pairs)
+    #We remove the old tadpole terms of the nodes whose degree or triangles
+    # change, and add them back at the end:
+    tadpoles = sum(triangles[u]*(degree[u] - 2) for u in nbrs)
+    #3-paths and 4-stars are centered at a node, so only the new node and its
+    # neighbors (whose degrees increase by one) contribute:
+    motifs[0] += k*(k - 1)/2 + sum(degree.values())
+    motifs[4] += (k*(k - 1)*(k - 2)/6
+                  + sum(d*(d - 1)/2 for d in degree.values()))
+    #New triangles are the edges among the neighbors, and new 4-cliques are
+    # the triangles among them:
+    motifs[1] += e_nbrs
+    motifs[3] += sum(len(adj[a] & adj[b] & nbrs) for a, b in pairs)/3
+    #4-paths with the new node at one end (v-u-w-x) or in the middle (a-v-u-x):
+    ends = sum(len(adj[w]) - 1 for u in nbrs for w in adj[u])
+    middles = (k - 1)*sum(degree.values()) - 2*e_nbrs
+    motifs[2] += ends + middles
+    #Squares through the new node are pairs of its neighbors with another
+    # common neighbor:
+    shared = {}
+    for a in nbrs:
+        for x in adj[a]:
+            shared[x] = shared.get(x, 0) + 1
+    motifs[5] += sum(c*(c - 1)/2 for c in shared.values())
+    #Diamonds are counted by their diagonal edge: the new edges have the
+    # neighbors' neighbors among nbrs as common neighbors, and the old edges
+    # among nbrs gain the new node as a common neighbor:
+    motifs[6] += sum(len(adj[u] & nbrs)*(len(adj[u] & nbrs) - 1)/2
+                     for u in nbrs)
+    motifs[6] += sum(len(adj[a] & adj[b]) for a, b in pairs)
+    #Finally we update the graph itself and the tadpoles:
+    adj[node] = nbrs
+    for u in nbrs:
+        adj[u].add(node)
+    for a, b in pairs:
+        triangles[a] += 1
+        triangles[b] += 1
+    triangles[node] = e_nbrs
+    new_tadpoles = sum(triangles[u]*(degree[u] - 1) for u in nbrs)
+    new_tadpoles += e_nbrs*(k - 2)
+    motifs[7] += new_tadpoles - tadpoles
+    return motifs
+
 #############################################################################
 '''Non-nested subgraph counting'''
 
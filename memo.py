@@ -0,0 +1,103 @@
+'''              Memoizing motif vectors of identical graphs               '''
+
+#This script contains all functions necessary to store motif vectors on disk
+# and reuse them whenever we count a graph we have already seen. Reruns and
+# parameter sweeps often produce graphs that are identical after the
+# simplification, and then there is no need to count them again.
+
+#Each graph is identified by a fingerprint of its sorted edge array together
+# with the version of the counting code. Every entry is a small .npz file in
+# the memo directory holding the motif vector and the time each count took.
+# The modification time of a file marks its last use, so that we can evict
+# the least recently used entries once the memo grows past its size.
+
+#############################################################################
+
+import os
+import hashlib
+import numpy as np
+import networkx as nx
+
+import mcount
+
+#############################################################################
+'''Fingerprints'''
+
+#The edge array of a simple graph, with each edge written as (smaller node,
+# larger node) and the rows sorted. Nodes are the integer ids from OSM:
+def get_edge_array(graph):
+    edges = np.array(list(graph.edges()), dtype=np.int64).reshape(-1, 2)
+    edges = np.sort(edges, axis=1)
+    order = np.lexsort((edges[:, 1], edges[:, 0]))
+    return edges[order]
+
+#The fingerprint hashes the edge array and the versions of the counting code,
+# so that results from an older version are never reused:
+def get_fingerprint(graph):
+    edges = np.ascontiguousarray(get_edge_array(graph))
+    h = hashlib.blake2b(digest_size=20)
+    h.update(("mcount " + mcount.version + ", networkx "
+              + nx.__version__).encode())
+    h.update(edges.tobytes())
+    return h.hexdigest()
+
+#############################################################################
+'''Memo store'''
+
+def get_entry_path(fingerprint, memo_dir):
+    return os.path.join(memo_dir, fingerprint + ".npz")
+
+#Returns the motif vector and the timings dictionary stored for this
+# fingerprint, or (None, None) if there is no entry. A hit marks the entry as
+# recently used:
+def lookup(fingerprint, memo_dir):
+    path = get_entry_path(fingerprint, memo_dir)
+    try:
+        with np.load(path) as entry:
+            motifs = entry["motifs"]
+            timings = dict(zip(entry["timing_names"].tolist(),
+                               entry["timing_values"].tolist()))
+    except (OSError, KeyError, ValueError):
+        return None, None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return motifs, timings
+
+#Stores a new entry, writing it to a temporary file first so that a crash (or
+# another process storing the same graph) never leaves a broken entry behind,
+# and then evicts old entries:
+def store(fingerprint, motifs, timings, memo_dir, max_entries=1000):
+    os.makedirs(memo_dir, exist_ok=True)
+    path = get_entry_path(fingerprint, memo_dir)
+    temp_path = path + "." + str(os.getpid()) + ".tmp"
+    names = list(timings.keys())
+    with open(temp_path, "wb") as f:
+        np.savez(f, motifs=np.asarray(motifs, dtype=float),
+                 timing_names=np.array(names, dtype=str),
+                 timing_values=np.array([timings[k] for k in names],
+                                        dtype=float))
+    os.replace(temp_path, path)
+    evict(memo_dir, max_entries)
+
+#Removes the least recently used entries until at most max_entries remain:
+def evict(memo_dir, max_entries):
+    entries = []
+    for name in os.listdir(memo_dir):
+        if name.endswith(".npz"):
+            path = os.path.join(memo_dir, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+    if len(entries) <= max_entries:
+        return
+    entries.sort()
+    for mtime, path in entries[:len(entries) - max_entries]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+#############################################################################
@@ -0,0 +1,192 @@
+'''         Splitting the download and the counting of city networks         '''
+
+#This script contains all functions necessary to run the download and the
+# motif counting of a list of cities in separate processes. The main process
+# downloads each graph, simplifies it, and writes it as CSR arrays (the node
+# ids, the pointers to each node's neighbors, and the neighbors themselves)
+# into .npy files. Counting workers open those files as memory maps, so the
+# graph is never pickled to them, and the main process drops the OSMnx graph
+# before moving on to the next city. Downloads of the next cities then
+# overlap with the counting of the previous ones.
+
+#Peak memory stays bounded: the main process holds a single OSMnx graph at
+# a time, each worker holds a single simple graph, and at most n_workers + 1
+# graphs are waiting in CSR files at once.
+
+#############################################################################
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import networkx as nx
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import mcount
+import memo
+import getdata
+
+#############################################################################
+'''Simplification and counting'''
+
+#These two functions are shared by get_network_info and the stages below.
+# The first takes the graph from OSMnx and returns its information (n, m,
+# m_simp, sl), the simple graph (without multiple edges and self-loops), its
+# fingerprint, and the motif vector if the graph is already in the memo:
+def simplify(graph, memo_dir=None):
+    n = graph.order()
+    m = graph.size()
+    sl = nx.number_of_selfloops(graph)
+    simple = nx.Graph(graph)
+    simple.remove_edges_from(nx.selfloop_edges(simple))
+    m_simp = simple.size()
+    fingerprint = None
+    motif_vector = None
+    if memo_dir is not None:
+        fingerprint = memo.get_fingerprint(simple)
+        motif_vector, timings = memo.lookup(fingerprint, memo_dir)
+    return (n, m, m_simp, sl), simple, fingerprint, motif_vector
+
+#The second counts the simple graph and stores the result in the memo:
+def count(simple, fingerprint=None, memo_dir=None, memo_size=1000):
+    timings = {}
+    motif_vector = mcount.get_motifvector(simple, timings)
+    if memo_dir is not None and fingerprint is not None:
+        memo.store(fingerprint, motif_vector, timings, memo_dir, memo_size)
+    return motif_vector
+
+#############################################################################
+'''CSR arrays'''
+
+#The CSR arrays of a simple graph. Nodes are the integer ids from OSM, and
+# neighbors are given by their position in the nodes array:
+def get_csr(graph):
+    nodes = list(graph.nodes())
+    position = {u: i for i, u in enumerate(nodes)}
+    indptr = [0]
+    indices = []
+    for u in nodes:
+        indices.extend(position[w] for w in graph[u])
+        indptr.append(len(indices))
+    return {"nodes": np.array(nodes, dtype=np.int64),
+            "indptr": np.array(indptr, dtype=np.int64),
+            "indices": np.array(indices, dtype=np.int64)}
+
+#And the simple graph back from its CSR arrays:
+def get_graph_from_csr(arrays):
+    nodes = arrays["nodes"].tolist()
+    indptr = arrays["indptr"]
+    indices = arrays["indices"]
+    rows = np.repeat(np.arange(len(nodes)), np.diff(indptr))
+    #Each edge appears once for each end, so we keep only one of them:
+    keep = indices > rows
+    graph = nx.Graph()
+    graph.add_nodes_from(nodes)
+    graph.add_edges_from((nodes[i], nodes[j])
+                         for i, j in zip(rows[keep].tolist(),
+                                         indices[keep].tolist()))
+    return graph
+
+#Writes the arrays as .npy files in a directory, with a prefix that tells
+# the cities apart. Returns the paths, which is all a worker needs:
+def export_arrays(arrays, directory, prefix):
+    paths = {}
+    for name, array in arrays.items():
+        path = os.path.join(directory, prefix + "_" + name + ".npy")
+        np.save(path, array)
+        paths[name] = path
+    return paths
+
+#Opens the files as memory maps, without reading them into memory:
+def attach_arrays(paths):
+    return {name: np.load(path, mmap_mode="r") for name, path in paths.items()}
+
+def remove_arrays(paths):
+    for path in paths.values():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+#############################################################################
+'''Stages'''
+
+#The download stage gets the graph and simplifies it. If the graph is already
+# in the memo, there is nothing to export and the motif vector is returned
+# right away. Returns the information (n, m, m_simp, sl), the motif vector
+# (or None), and the paths of the CSR files with the fingerprint (or None):
+def download_stage(city_str, directory, prefix, verbose=False, memo_dir=None):
+    if verbose == True:
+        print("city:", city_str)
+    graph = getdata.get_graph(city_str)
+    if graph is None:
+        if verbose == True:
+            print("We couldn't find a graph for this city.")
+        return None, None, None
+    info, simple, fingerprint, motif_vector = simplify(graph, memo_dir)
+    del graph
+    if motif_vector is not None:
+        if verbose == True:
+            print("Found the motif vector in the memo")
+        return info, motif_vector, None
+    paths = export_arrays(get_csr(simple), directory, prefix)
+    return info, None, (paths, fingerprint)
+
+#The counting stage runs on a worker. It rebuilds the simple graph from the
+# memory-mapped arrays, closes them, and counts:
+def count_stage(job, memo_dir=None, memo_size=1000):
+    paths, fingerprint = job
+    arrays = attach_arrays(paths)
+    graph = get_graph_from_csr(arrays)
+    del arrays
+    return count(graph, fingerprint, memo_dir, memo_size)
+
+#############################################################################
+'''Pipeline'''
+
+#The following function downloads the cities in order and hands them to
+# n_workers counting workers. It yields, as they finish, the position of each
+# city in the list and the same tuple as get_network_info. If a worker dies
+# (for instance, out of memory on a large city), the pool is broken and the
+# error (BrokenProcessPool) is raised here instead of waiting forever:
+def run_pipeline(city_strs, n_workers=2, memo_dir=None, memo_size=1000,
+                 verbose=False):
+    directory = tempfile.mkdtemp(prefix="csr_")
+    pending = {}
+    try:
+        with ProcessPoolExecutor(n_workers) as executor:
+            for idx in range(len(city_strs)):
+                info, motif_vector, job = download_stage(city_strs[idx],
+                                                         directory, str(idx),
+                                                         verbose, memo_dir)
+                if info is None:
+                    yield idx, (None, None, None, None, None)
+                    continue
+                if job is None:
+                    yield idx, info + (motif_vector,)
+                    continue
+                future = executor.submit(count_stage, job, memo_dir,
+                                         memo_size)
+                pending[future] = (idx, info, job[0])
+                #We yield whatever is done, and don't download further while
+                # all workers are busy and another city is already waiting:
+                done, running = wait(pending, timeout=0)
+                for future in done:
+                    yield collect(pending, future)
+                while len(pending) > n_workers:
+                    done, running = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield collect(pending, future)
+            while len(pending) > 0:
+                done, running = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield collect(pending, future)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def collect(pending, future):
+    idx, info, paths = pending.pop(future)
+    remove_arrays(paths)
+    return idx, info + (future.result(),)
+
+#############################################################################
@@ -0,0 +1,96 @@
+'''            Radial motif profiles from the centre of a city            '''
+
+#This script contains all functions necessary to compute motif vectors as a
+# function of the distance from a centre point (0.5 km, 1 km, ... up to the
+# outline of the city). Instead of counting every nested ego-graph again, we
+# sort the nodes by their distance from the centre and add them one at a
+# time, updating the counts incrementally with mcount.add_node. The motif
+# vector at each radius is then the cumulative vector once all the nodes
+# within that radius were added, so the whole curve costs about as much as a
+# single full count.
+
+#RMK: Graphs are expected as downloaded from OSMnx, with node coordinates "x"
+#      (longitude) and "y" (latitude) and edge lengths in meters.
+
+#############################################################################
+
+import numpy as np
+import networkx as nx
+
+import mcount
+
+#############################################################################
+'''Distances'''
+
+#Great-circle distance in km between a point and arrays of coordinates:
+def haversine(lat, lon, lats, lons):
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = (np.sin((lats - lat)/2)**2
+         + np.cos(lat)*np.cos(lats)*np.sin((lons - lon)/2)**2)
+    return 2*6371.0088*np.arcsin(np.sqrt(a))
+
+#The simple undirected graph we count on, as in get_network_info. Among
+# parallel edges we keep the shortest length, which is the one that matters
+# for network distances:
+def get_simple_graph(graph):
+    simple = nx.Graph()
+    simple.add_nodes_from(graph.nodes(data=True))
+    for u, v, data in graph.edges(data=True):
+        if u == v:
+            continue
+        length = data.get("length", 1.0)
+        if simple.has_edge(u, v):
+            length = min(length, simple[u][v]["length"])
+        simple.add_edge(u, v, length=length)
+    return simple
+
+#Distance (in km) from the centre, given as (latitude, longitude), to every
+# node. The metric can be "euclidean" (straight line) or "network" (along the
+# streets from the node closest to the centre). Nodes that cannot be reached
+# through the network are left out:
+def get_node_distances(graph, centre, metric="euclidean"):
+    nodes = list(graph.nodes())
+    lats = np.array([graph.nodes[u]["y"] for u in nodes])
+    lons = np.array([graph.nodes[u]["x"] for u in nodes])
+    euclidean = haversine(centre[0], centre[1], lats, lons)
+    if metric == "euclidean":
+        return dict(zip(nodes, euclidean))
+    elif metric == "network":
+        source = nodes[int(np.argmin(euclidean))]
+        lengths = nx.single_source_dijkstra_path_length(graph, source,
+                                                        weight="length")
+        return {u: d/1000 for u, d in lengths.items()}
+    else:
+        raise ValueError("metric must be 'euclidean' or 'network'")
+
+#############################################################################
+'''Radial profiles'''
+
+#The following function returns the radii (in km) and an array with one
+# motif vector per radius, each counting the subgraph induced by the nodes
+# within that distance from the centre. If no radii are given, we use steps
+# of 0.5 km until the farthest node:
+def get_radial_profile(graph, centre, radii=None, metric="euclidean",
+                       step=0.5):
+    simple = get_simple_graph(graph)
+    distances = get_node_distances(simple, centre, metric)
+    order = sorted(distances, key=distances.get)
+    if radii is None:
+        farthest = distances[order[-1]] if len(order) > 0 else 0
+        radii = np.arange(step, farthest + step, step)
+    radii = np.sort(np.asarray(radii, dtype=float))
+    profile = np.zeros((len(radii), 8))
+    adj = {}
+    triangles = {}
+    motifs = np.zeros(8)
+    i = 0
+    for r_idx in range(len(radii)):
+        while i < len(order) and distances[order[i]] <= radii[r_idx]:
+            node = order[i]
+            mcount.add_node(adj, triangles, motifs, node, simple[node])
+            i += 1
+        profile[r_idx] = motifs
+    return radii, profile
+
+#############################################################################
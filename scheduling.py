@@ -0,0 +1,153 @@
+'''             Scheduling and sharding batches of city networks             '''
+
+#This script contains all functions necessary to split the list of cities
+# into balanced shards that independent machines can run. Runtimes are very
+# skewed (a Tokyo-sized city takes far longer than a small one), so we first
+# estimate the cost of each city and then hand out the most expensive cities
+# first, always to the least loaded shard. The outputs of the shards can be
+# merged back into a single dataframe afterwards.
+
+#############################################################################
+
+import heapq
+import hashlib
+import numpy as np
+import pandas as pd
+
+#############################################################################
+'''Cost estimation'''
+
+#The cost of a city is roughly linear on the size of its network, since the
+# download, the simplification and the motif counting all go over its nodes
+# and edges. When a previous run produced "cities.csv", we use the sum of the
+# number of nodes and of essential edges found there. Returns a list with
+# either a cost or None for each city:
+def get_known_costs(cities, countries, cities_df):
+    known = {}
+    for idx in range(len(cities_df)):
+        row = cities_df.iloc[idx]
+        if pd.isnull(row["Nodes"]) or pd.isnull(row["Essential edges"]):
+            continue
+        known[(row["City"], row["Country"])] = (row["Nodes"]
+                                                + row["Essential edges"])
+    costs = []
+    for city, country in zip(cities, countries):
+        costs.append(known.get((city, country), None))
+    return costs
+
+#When a city was never counted, we can still guess its cost from the area of
+# its outline. The density (cost per unit of area) is calibrated on the cities
+# for which we know both. When no cost is known at all, the area itself is
+# the cost, since we only need the cities in the right order. The areas are
+# given as a list with None for the cities whose outline could not be found
+# or was not requested. Cities with no estimate at all (including those with
+# an area but no way to calibrate it against known costs) receive the median
+# of the other costs:
+def estimate_costs(cities, countries, cities_df=None, areas=None):
+    if cities_df is not None:
+        costs = get_known_costs(cities, countries, cities_df)
+    else:
+        costs = [None]*len(cities)
+    if areas is None:
+        areas = [None]*len(cities)
+    #We calibrate the density on the cities that have both values:
+    densities = [cost/area for cost, area in zip(costs, areas)
+                 if cost is not None and area is not None and area > 0]
+    known_costs = [cost for cost in costs if cost is not None]
+    if len(densities) > 0:
+        density = float(np.median(densities))
+    elif len(known_costs) == 0:
+        density = 1.0
+    else:
+        #Raw areas are not comparable with known costs:
+        density = None
+    estimated = []
+    for cost, area in zip(costs, areas):
+        if cost is not None:
+            estimated.append(float(cost))
+        elif area is not None and density is not None:
+            estimated.append(float(area*density))
+        else:
+            estimated.append(None)
+    others = [cost for cost in estimated if cost is not None]
+    if len(others) > 0:
+        default_cost = float(np.median(others))
+    else:
+        default_cost = 1.0
+    return [default_cost if cost is None else cost for cost in estimated]
+
+#############################################################################
+'''Ordering and sharding'''
+
+#Indices of the cities ordered from the most expensive to the cheapest:
+def order_by_cost(costs):
+    return sorted(range(len(costs)), key=lambda idx: costs[idx], reverse=True)
+
+#The following function splits the cities into n_shards lists of indices
+# following the longest-processing-time rule: cities are taken longest-first
+# and each one is given to the shard with the smallest total cost so far. The
+# largest shard is then never more than 4/3 of the optimal one, so the batch
+# wall-clock time approaches sum(costs)/n_shards. Each shard is itself
+# ordered longest-first, so that no long city is left for the end:
+def get_shards(costs, n_shards):
+    shards = [[] for _ in range(n_shards)]
+    heap = [(0.0, shard) for shard in range(n_shards)]
+    heapq.heapify(heap)
+    for idx in order_by_cost(costs):
+        load, shard = heapq.heappop(heap)
+        shards[shard].append(idx)
+        heapq.heappush(heap, (load + costs[idx], shard))
+    return shards
+
+#Total estimated cost of each shard, which we can compare with the ideal
+# value sum(costs)/n_shards:
+def get_shard_loads(costs, shards):
+    return [sum(costs[idx] for idx in shard) for shard in shards]
+
+#All machines must agree on the split, so it is computed once and stored as
+# a dataframe with one row per city (in the order it should be run). Every
+# row also records the number of shards and a key of the list of cities, so
+# that a split made for another list or another number of shards (even with
+# some empty shards) is never reused:
+def get_list_key(cities, countries):
+    h = hashlib.sha1()
+    h.update(str(len(cities)).encode())
+    for city, country in zip(cities, countries):
+        h.update(("\n" + city + ";" + country).encode())
+    return h.hexdigest()
+
+def shards_dataframe(shards, costs, key):
+    rows = []
+    for shard in range(len(shards)):
+        for idx in shards[shard]:
+            rows.append([idx, shard, costs[idx], len(shards), key])
+    return pd.DataFrame(rows, columns=["Index", "Shard", "Cost", "Shards",
+                                       "Key"])
+
+#Returns the stored split, or None if it does not match the current list:
+def read_shards(shards_df, n_shards, key):
+    if len(shards_df) == 0 or "Key" not in shards_df.keys():
+        return None
+    if (shards_df["Shards"] != n_shards).any():
+        return None
+    if (shards_df["Key"] != key).any():
+        return None
+    shards = [[] for _ in range(n_shards)]
+    for idx, shard in zip(shards_df["Index"], shards_df["Shard"]):
+        shards[shard].append(int(idx))
+    return shards
+
+#############################################################################
+'''Merging'''
+
+#Each shard writes its own csv file, in which the rows keep the index of the
+# city in the original list. We merge them back by concatenating and sorting
+# by that index:
+def merge_shards(shard_files):
+    dfs = [pd.read_csv(shard_file, index_col=0) for shard_file in shard_files]
+    df = pd.concat(dfs)
+    df = df[~df.index.duplicated(keep="last")]
+    df = df.sort_index()
+    return df
+
+#############################################################################
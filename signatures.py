@@ -0,0 +1,190 @@
+'''            Similarity index over the motif signatures of cities            '''
+
+#This script contains all functions necessary to compare cities (or tiles of
+# cities) by their motifs. We build normalized signature vectors from the
+# motif counts in the dataframe produced by "cities_dataframe.py" and store
+# them in a nearest-neighbour index, so that queries such as "the 10 cities
+# most similar to Porto Alegre" don't need pairwise loops over the table.
+
+#There are three kinds of signatures:
+#  - "raw": the motif vector divided by its sum;
+#  - "nnest": the non-nested motif vector divided by its sum;
+#  - "ratio": log10 of the motif vector over the expectation in an
+#     Erdos-Renyi graph with the same number of nodes and essential edges.
+
+#############################################################################
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import mcount
+
+#############################################################################
+'''Signatures'''
+
+#The motif columns in the dataframe follow the indexation of mcount:
+motif_columns = mcount.motif_names
+
+kinds = ["raw", "nnest", "ratio"]
+
+#Signature of a single motif vector, given the number of nodes and of
+# essential edges of the graph (only needed for the ratio):
+def get_signature(motifs, n=None, m=None, kind="ratio"):
+    motifs = np.asarray(motifs, dtype=float)
+    if kind == "raw":
+        total = motifs.sum()
+        return motifs/total if total > 0 else motifs
+    elif kind == "nnest":
+        nnest_motifs = mcount.get_nnest_motifvector(motifs)
+        total = nnest_motifs.sum()
+        return nnest_motifs/total if total > 0 else nnest_motifs
+    elif kind == "ratio":
+        random_motifs = mcount.get_random_motifvector(n, m)
+        #We add one to both so that absent motifs don't blow up the log:
+        return np.log10((motifs + 1)/(random_motifs + 1))
+    else:
+        raise ValueError("kind must be one of " + ", ".join(kinds))
+
+#Labels and signatures of every city in the dataframe. Cities without a
+# network (empty rows) are left out:
+def get_signatures(cities_df, kind="ratio"):
+    df = cities_df.dropna(subset=motif_columns + ["Nodes", "Essential edges"])
+    labels = (df["City"].str.replace("_", " ") + ", "
+              + df["Country"].str.replace("_", " ")).tolist()
+    vectors = np.zeros((len(df), 8))
+    motifs = df[motif_columns].to_numpy(dtype=float)
+    nodes = df["Nodes"].to_numpy(dtype=float)
+    edges = df["Essential edges"].to_numpy(dtype=float)
+    for idx in range(len(df)):
+        vectors[idx] = get_signature(motifs[idx], nodes[idx], edges[idx],
+                                     kind)
+    return labels, vectors
+
+#############################################################################
+'''Nearest-neighbour index'''
+
+#The index keeps a KD-tree over most of the signatures and a small buffer
+# with the ones inserted since the tree was last built. Queries look at both:
+# the tree in logarithmic time and the buffer by brute force. The buffer is a
+# list of chunks (one per insert), so inserting never copies the signatures
+# already stored; only once the buffer reaches buffer_size are the chunks
+# joined and the tree rebuilt with everything.
+
+class SignatureIndex:
+
+    def __init__(self, kind="ratio", buffer_size=1024):
+        self.kind = kind
+        self.buffer_size = buffer_size
+        self.labels = []
+        self.positions = {}
+        self.tree_vectors = np.zeros((0, 8))  #the first n_tree signatures
+        self.chunks = []                      #and the ones after them
+        self.n_buffer = 0
+        self.buffer = None                    #the chunks joined, when needed
+        self.tree = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def n_tree(self):
+        return len(self.tree_vectors)
+
+    #All signatures in the order of the labels:
+    @property
+    def vectors(self):
+        return np.concatenate([self.tree_vectors, self.get_buffer()])
+
+    def get_buffer(self):
+        if self.buffer is None:
+            if len(self.chunks) > 0:
+                self.buffer = np.concatenate(self.chunks)
+            else:
+                self.buffer = np.zeros((0, 8))
+            self.chunks = [self.buffer] if len(self.buffer) > 0 else []
+        return self.buffer
+
+    #Labels must be unique, since queries by label refer to a single entry,
+    # and there must be one for each vector. Both are checked before anything
+    # changes in the index. The tree is rebuilt when the buffer is full,
+    # unless rebuild is False:
+    def insert(self, labels, vectors, rebuild=True):
+        labels = list(labels)
+        vectors = np.array(vectors, dtype=float).reshape(-1, 8)
+        if len(labels) != len(vectors):
+            raise ValueError("Got " + str(len(labels)) + " labels for "
+                             + str(len(vectors)) + " vectors")
+        if len(set(labels)) != len(labels):
+            raise ValueError("Repeated labels in the same insert")
+        for label in labels:
+            if label in self.positions:
+                raise ValueError("Label already in the index: " + str(label))
+        for label in labels:
+            self.positions[label] = len(self.labels)
+            self.labels.append(label)
+        if len(vectors) > 0:
+            self.chunks.append(vectors)
+            self.n_buffer += len(vectors)
+            self.buffer = None
+        if rebuild == True and self.n_buffer >= self.buffer_size:
+            self.rebuild()
+
+    def insert_dataframe(self, cities_df):
+        labels, vectors = get_signatures(cities_df, self.kind)
+        self.insert(labels, vectors)
+
+    def rebuild(self):
+        self.tree_vectors = self.vectors
+        self.chunks = []
+        self.n_buffer = 0
+        self.buffer = None
+        if self.n_tree > 0:
+            self.tree = cKDTree(self.tree_vectors)
+        else:
+            self.tree = None
+
+    #Returns the labels and distances of the k nearest signatures:
+    def query(self, vector, k=10):
+        vector = np.asarray(vector, dtype=float)
+        distances = []
+        indices = []
+        if self.tree is not None:
+            kk = min(k, self.n_tree)
+            d, i = self.tree.query(vector, k=kk)
+            distances.append(np.atleast_1d(d))
+            indices.append(np.atleast_1d(i))
+        buffer = self.get_buffer()
+        if len(buffer) > 0:
+            distances.append(np.sqrt(((buffer - vector)**2).sum(axis=1)))
+            indices.append(np.arange(self.n_tree, self.n_tree + len(buffer)))
+        if len(distances) == 0:
+            return [], np.zeros(0)
+        distances = np.concatenate(distances)
+        indices = np.concatenate(indices)
+        best = np.argsort(distances, kind="stable")[:k]
+        return [self.labels[i] for i in indices[best]], distances[best]
+
+    #The k entries most similar to one already in the index, excluding it:
+    def query_label(self, label, k=10):
+        position = self.positions[label]
+        if position < self.n_tree:
+            vector = self.tree_vectors[position]
+        else:
+            vector = self.get_buffer()[position - self.n_tree]
+        labels, distances = self.query(vector, k + 1)
+        keep = [i for i in range(len(labels)) if labels[i] != label][:k]
+        return [labels[i] for i in keep], distances[keep]
+
+    def save(self, path):
+        np.savez(path, kind=self.kind, labels=np.array(self.labels, dtype=str),
+                 vectors=self.vectors)
+
+#Loading builds the tree once, which is much faster than storing it:
+def load_index(path, buffer_size=1024):
+    with np.load(path) as data:
+        index = SignatureIndex(str(data["kind"]), buffer_size)
+        index.insert(data["labels"].tolist(), data["vectors"], rebuild=False)
+    index.rebuild()
+    return index
+
+#############################################################################